@@ -1,24 +1,38 @@
 # import pandas as pd
 # import numpy as np
 # import matplotlib.pyplot as plt
+from functools import reduce
+
 import FinanceDataReader as fdr
 from model import *
 
 
+def log_returns(close):
+    """
+    Daily log returns from one pass of np.log over the closing prices; the first entry is NaN.
+    """
+
+    log_close = np.log(close.values)
+    return np.concatenate(([np.nan], np.diff(log_close)))
+
+
 samsungElec = fdr.DataReader('005930', '2018-07-13', '2019-12-31')
-samsungElec['log_return'] = np.log(samsungElec.Close) - np.log(samsungElec.Close.shift(1))
+samsungElec['log_return'] = log_returns(samsungElec.Close)
 
 KGMobil = fdr.DataReader('046440', '2018-07-13', '2019-12-31')
-KGMobil['log_return'] = np.log(KGMobil.Close) - np.log(KGMobil.Close.shift(1))
+KGMobil['log_return'] = log_returns(KGMobil.Close)
 
 hyosungChem = fdr.DataReader('298000', '2017-01-01', '2019-12-31')
-hyosungChem['log_return'] = np.log(hyosungChem.Close) - np.log(hyosungChem.Close.shift(1))
+hyosungChem['log_return'] = log_returns(hyosungChem.Close)
 
 celltrion = fdr.DataReader('068270', '2017-01-01')
-celltrion['log_return'] = np.log(celltrion.Close) - np.log(celltrion.Close.shift(1))
+celltrion['log_return'] = log_returns(celltrion.Close)
 
-dfReturns = pd.concat([samsungElec['log_return'], KGMobil['log_return'], hyosungChem['log_return'], celltrion['log_return']], axis=1, join='inner')
-dfReturns.columns = ['삼성전자', 'KG 모빌리언스', '효성화학', '셀트리온']
+# Align the return series on their common trading days and stack them into one array
+returnSeries = [samsungElec['log_return'], KGMobil['log_return'], hyosungChem['log_return'], celltrion['log_return']]
+commonDates = reduce(np.intersect1d, [series.index.values for series in returnSeries])
+dfReturns = pd.DataFrame(np.column_stack([series.loc[commonDates].values for series in returnSeries]),
+                         index=pd.DatetimeIndex(commonDates), columns=['삼성전자', 'KG 모빌리언스', '효성화학', '셀트리온'])
 dfReturns = dfReturns[1:]
 
 correlation = dfReturns.corr()
@@ -50,7 +64,8 @@ stocks = ['삼성전자', 'KG 모빌리언스', '효성화학', '셀트리온']
 correlation = pd.DataFrame(correlation, index=stocks, columns=stocks)
 volatilities = pd.DataFrame(volatilities,
                             index=stocks, columns=["vol"])
-covariance = volatilities.dot(volatilities.T) * correlation
+vol = volatilities.values.ravel()
+covariance = pd.DataFrame(np.multiply.outer(vol, vol) * correlation.values, index=stocks, columns=stocks)
 cap_weights = pd.DataFrame(cap_weights,
                               index=stocks, columns=["CapWeight"])
 
@@ -62,5 +77,5 @@ bl.allocate(covariance=covariance,
             asset_names=covariance.columns,
             tau=0.05,
             risk_aversion=2.5)
-print(bl.weights)
+print(bl.weights_df)
 
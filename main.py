@@ -1,6 +1,7 @@
 from portfoliolab.bayesian import VanillaBlackLitterman
-from model import BlackLitterman
+from model import BlackLitterman, precompute_prior
 import pandas as pd
+import numpy as np
 countries = ['AU', 'CA', 'FR', 'DE', 'JP', 'UK', 'US']
 # Table 1 of the He-Litterman paper: Correlation matrix
 correlation = pd.DataFrame([
@@ -15,12 +16,16 @@ correlation = pd.DataFrame([
 # Table 2 of the He-Litterman paper: Volatilities
 volatilities = pd.DataFrame([0.160, 0.203, 0.248, 0.271, 0.210, 0.200, 0.187],
                             index=countries, columns=["vol"])
-covariance = volatilities.dot(volatilities.T) * correlation
+vol = volatilities.values.ravel()
+covariance = pd.DataFrame(np.multiply.outer(vol, vol) * correlation.values, index=countries, columns=countries)
 
 # Table 2 of the He-Litterman paper: Market-capitalised weights
 market_weights = pd.DataFrame([0.016, 0.022, 0.052, 0.055, 0.116, 0.124, 0.615],
                               index=countries, columns=["CapWeight"])
 
+# The prior is shared by all the allocations below
+implied_returns = precompute_prior(covariance, market_weights, risk_aversion=2.5)
+
 # Q
 views = [0.05]
 # P
@@ -40,8 +45,9 @@ bl.allocate(covariance=covariance,
             pick_list=pick_list,
             asset_names=covariance.columns,
             tau=0.05,
-            risk_aversion=2.5)
-print(bl.weights)
+            risk_aversion=2.5,
+            implied_equilibrium_returns=implied_returns)
+print(bl.weights_df)
 
 # Q
 views2 = [0.05, 0.03]
@@ -65,8 +71,9 @@ bl2.allocate(covariance=covariance,
             pick_list=pick_list2,
             asset_names=covariance.columns,
             tau=0.05,
-            risk_aversion=2.5)
-print(bl2.weights)
+            risk_aversion=2.5,
+            implied_equilibrium_returns=implied_returns)
+print(bl2.weights_df)
 
 # Q
 views3 = [0.05, 0.04]
@@ -90,5 +97,6 @@ bl3.allocate(covariance=covariance,
             pick_list=pick_list3,
             asset_names=covariance.columns,
             tau=0.05,
-            risk_aversion=2.5)
-print(bl3.weights)
\ No newline at end of file
+            risk_aversion=2.5,
+            implied_equilibrium_returns=implied_returns)
+print(bl3.weights_df)
\ No newline at end of file
@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from numpy.linalg import inv
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
 
 class BlackLitterman:
 
@@ -10,9 +10,86 @@ class BlackLitterman:
         self.implied_equilibrium_returns = None
         self.posterior_expected_returns = None
         self.posterior_covariance = None
+        self._asset_names = None
+        self._posterior_covariance_factor = None
+
+    def __repr__(self):
+
+        if self.weights is None:
+            return '{}()'.format(type(self).__name__)
+        return '{} weights:\n{!r}'.format(type(self).__name__, self.weights_df)
+
+    @property
+    def weights_df(self):
+        """
+        (pd.DataFrame) Max Sharpe weights labelled by asset name.
+        """
+
+        return pd.DataFrame(self.weights, columns=self._asset_names)
+
+    @property
+    def implied_equilibrium_returns_df(self):
+        """
+        (pd.DataFrame) Implied equilibrium returns labelled by asset name.
+        """
+
+        return pd.DataFrame(self.implied_equilibrium_returns, columns=self._asset_names)
+
+    @property
+    def posterior_expected_returns_df(self):
+        """
+        (pd.DataFrame) Posterior expected returns labelled by asset name.
+        """
+
+        return pd.DataFrame(self.posterior_expected_returns, columns=self._asset_names)
+
+    @property
+    def posterior_covariance_df(self):
+        """
+        (pd.DataFrame) Posterior covariance labelled by asset name.
+        """
+
+        return pd.DataFrame(self.posterior_covariance, columns=self._asset_names, index=self._asset_names)
 
     def allocate(self, covariance, market_capitalised_weights, investor_views, pick_list, omega=None, risk_aversion=2.5, tau=0.05,
-                 omega_method='prior_variance', view_confidences=None, asset_names=None):
+                 omega_method='prior_variance', view_confidences=None, asset_names=None, implied_equilibrium_returns=None):
+
+        investor_views = np.array(np.reshape(investor_views, newshape=(len(investor_views), 1)))
+        self._allocate(covariance, market_capitalised_weights, investor_views, pick_list, omega, risk_aversion, tau, omega_method,
+                       view_confidences, asset_names, implied_equilibrium_returns)
+
+    def allocate_batch(self, covariance, market_capitalised_weights, investor_views_batch, pick_list, omega=None, risk_aversion=2.5,
+                       tau=0.05, omega_method='prior_variance', view_confidences=None, asset_names=None,
+                       implied_equilibrium_returns=None):
+        """
+        Allocate for a batch of view vectors sharing the same pick matrix, e.g. for Monte-Carlo sampling of views. The
+        Cholesky factorisation of (P tau Sigma P' + omega) and the posterior covariance are computed once for the whole batch.
+        All other parameters are the same as for allocate, and the weights and posterior expected returns attributes hold
+        one row per set of views afterwards.
+
+        :param investor_views_batch: (Numpy matrix) B x K matrix with one set of investor views per row. With a single view
+                                                    a flat vector of B draws is also accepted.
+        :return: (Numpy matrix) B x N matrix of max Sharpe weights, one row per set of views.
+        """
+
+        num_views = len(pick_list)
+        investor_views_batch = np.asarray(investor_views_batch, dtype=np.float64)
+        if investor_views_batch.ndim == 1 and num_views == 1:
+            investor_views_batch = investor_views_batch.reshape(-1, 1)
+        if investor_views_batch.ndim != 2 or investor_views_batch.shape[1] != num_views:
+            raise ValueError("The views batch must be a B x K matrix with one column per element in the pick list.")
+
+        self._allocate(covariance, market_capitalised_weights, investor_views_batch.T, pick_list, omega, risk_aversion, tau,
+                       omega_method, view_confidences, asset_names, implied_equilibrium_returns)
+        return self.weights
+
+    def _allocate(self, covariance, market_capitalised_weights, investor_views, pick_list, omega, risk_aversion, tau, omega_method,
+                  view_confidences, asset_names, implied_equilibrium_returns):
+        """
+        Shared implementation of allocate and allocate_batch.
+
+        :param investor_views: (Numpy matrix) K x B matrix holding one set of investor views per column.
+        """
 
         # Initial check of inputs.
         self._error_checks(investor_views, pick_list, omega_method, view_confidences)
@@ -24,25 +101,40 @@ class BlackLitterman:
                 asset_names = covariance.columns
             else:
                 asset_names = list(map(str, range(num_assets)))
-        covariance, market_capitalised_weights, investor_views = self._pre_process_inputs(covariance, market_capitalised_weights, investor_views)
+        covariance, market_capitalised_weights = self._pre_process_inputs(covariance, market_capitalised_weights)
 
-        # Calculate the implied excess market equilibrium returns using reverse optimisation trick
-        self.implied_equilibrium_returns = self._calculate_implied_equilibrium_returns(risk_aversion, covariance, market_capitalised_weights)
+        # Calculate the implied excess market equilibrium returns using reverse optimisation trick, unless precomputed.
+        # A precomputed prior is used as is, so risk_aversion and market_capitalised_weights are ignored in that case
+        if implied_equilibrium_returns is None:
+            self.implied_equilibrium_returns = self._calculate_implied_equilibrium_returns(risk_aversion, covariance, market_capitalised_weights)
+        else:
+            self.implied_equilibrium_returns = np.array(np.reshape(implied_equilibrium_returns, (num_assets, 1)))
 
         # Create the pick matrix (P) from user specified assets involved in the views
         pick_matrix = self._create_pick_matrix(num_views, num_assets, pick_list, asset_names)
         print(pick_matrix)
 
+        # Products of the scaled prior covariance shared by omega and the posterior estimates
+        tau_covariance = tau * covariance
+        pick_tau_covariance = pick_matrix.dot(tau_covariance)
+        views_prior_covariance = pick_tau_covariance.dot(pick_matrix.T)
+
         # Build the covariance matrix of errors in investor views (omega)
         if omega is None:
-            omega = self._calculate_omega(covariance, tau, pick_matrix, view_confidences, omega_method)
+            omega = self._calculate_omega(covariance, views_prior_covariance, pick_matrix, view_confidences, omega_method)
         omega = np.array(np.reshape(omega, (num_views, num_views)))
 
+        # Factorise the symmetric positive-definite view matrix (P tau Sigma P' + omega) once and share it
+        views_factor = cho_factor(views_prior_covariance + omega, lower=True)
+
         # BL expected returns
-        self.posterior_expected_returns = self._calculate_posterior_expected_returns(covariance, tau, pick_matrix, omega, investor_views)
+        self.posterior_expected_returns = self._calculate_posterior_expected_returns(pick_tau_covariance, pick_matrix, views_factor, investor_views)
 
         # BL covariance
-        self.posterior_covariance = self._calculate_posterior_covariance(covariance, tau, pick_matrix, omega)
+        self.posterior_covariance = self._calculate_posterior_covariance(covariance, tau_covariance, pick_tau_covariance, views_factor)
+
+        # Cache the Cholesky factor of the posterior covariance for the weights, sampling and density evaluations
+        self._posterior_covariance_factor = cho_factor(self.posterior_covariance, lower=True)
 
         # Get optimal weights
         self.weights = self._calculate_max_sharpe_weights()
@@ -50,61 +142,106 @@ class BlackLitterman:
         # Post processing
         self._post_processing(asset_names)
 
+    def sample(self, num_samples, random_state=None):
+        """
+        Draw asset return scenarios from the posterior distribution N(posterior expected returns, posterior covariance),
+        reusing the Cholesky factor cached by allocate.
+
+        :param num_samples: (int) Number of scenarios to draw.
+        :param random_state: (int/np.random.Generator) Seed or generator used for the draws.
+        :return: (Numpy matrix) num_samples x N matrix of sampled asset returns.
+        """
+
+        mean = self._posterior_mean()
+        factor, _ = self._posterior_covariance_factor
+        standard_normals = np.random.default_rng(random_state).standard_normal((num_samples, len(mean)))
+        return mean + standard_normals.dot(np.tril(factor).T)
+
+    def log_pdf(self, asset_returns):
+        """
+        Evaluate the log density of the posterior distribution of asset returns, reusing the Cholesky factor cached by allocate.
+
+        :param asset_returns: (Numpy array/Numpy matrix) A vector of N asset returns or an M x N matrix with one scenario per row.
+        :return: (float/Numpy array) Log density of each scenario.
+        """
+
+        mean = self._posterior_mean()
+        asset_returns = np.asarray(asset_returns, dtype=np.float64)
+        deviations = np.atleast_2d(asset_returns) - mean
+        factor, _ = self._posterior_covariance_factor
+        mahalanobis = np.sum(deviations * cho_solve(self._posterior_covariance_factor, deviations.T).T, axis=1)
+        log_determinant = 2 * np.sum(np.log(np.diag(factor)))
+        log_density = -0.5 * (mahalanobis + log_determinant + len(mean) * np.log(2 * np.pi))
+        return log_density[0] if asset_returns.ndim == 1 else log_density
+
+    def _posterior_mean(self):
+        """
+        Posterior expected returns of a single allocation as a flat vector.
+
+        :return: (Numpy array) Posterior expected returns.
+        """
+
+        if self._posterior_covariance_factor is None:
+            raise ValueError("The posterior distribution is not available. Please call allocate first.")
+        if self.posterior_expected_returns.shape[0] != 1:
+            raise ValueError("The posterior distribution is only defined for a single set of views, not a batch.")
+        return self.posterior_expected_returns[0]
+
     @staticmethod
-    def _pre_process_inputs(covariance, market_capitalised_weights, investor_views):
+    def _pre_process_inputs(covariance, market_capitalised_weights):
         """
         Initial preprocessing of inputs.
 
         :param covariance: (pd.DataFrame/Numpy matrix) The covariance matrix of asset returns.
         :param market_capitalised_weights: (Numpy array/Python list) List of market capitalised weights of assets.
-        :param investor_views: (Numpy array/Python list) User-specified list of views expressed in the form of percentage excess returns.
-        :return: (Numpy matrix, Numpy array, Numpy matrix) Preprocessed inputs.
+        :return: (Numpy matrix, Numpy array) Preprocessed inputs.
         """
 
-        investor_views = np.array(np.reshape(investor_views, newshape=(len(investor_views), 1)))
         market_capitalised_weights = np.array(np.reshape(market_capitalised_weights, newshape=(len(market_capitalised_weights), 1)))
         if isinstance(covariance, pd.DataFrame):
             covariance = covariance.values
+        covariance = np.asarray(covariance, dtype=np.float64)
 
-        return covariance, market_capitalised_weights, investor_views
+        return covariance, market_capitalised_weights
 
     def _calculate_max_sharpe_weights(self):
 
-        weights = inv(self.posterior_covariance).dot(self.posterior_expected_returns.T)
-        weights /= sum(weights)
+        weights = cho_solve(self._posterior_covariance_factor, self.posterior_expected_returns.T)
+        weights /= weights.sum(axis=0)
         return weights
 
-    def _calculate_posterior_expected_returns(self, covariance, tau, pick_matrix, omega, investor_views):
+    def _calculate_posterior_expected_returns(self, pick_tau_covariance, pick_matrix, views_factor, investor_views):
         """
         Calculate Black-Litterman expected returns from investor views.
 
-        :param covariance: (pd.DataFrame/Numpy matrix) The covariance matrix of asset returns.
-        :param tau: (float) Constant of proportionality.
+        :param pick_tau_covariance: (Numpy matrix) Pick matrix multiplied by the tau-scaled covariance matrix (P tau Sigma).
         :param pick_matrix: (Numpy matrix) Matrix specifying which assets involved in the respective view.
-        :param omega: (Numpy matrix) Diagonal matrix of variance in investor views.
+        :param views_factor: (tuple) Cholesky factorisation of (P tau Sigma P' + omega) as returned by scipy's cho_factor.
         :param investor_views: (Numpy array/Python list) User-specified list of views expressed in the form of percentage excess returns.
         :return: (Numpy array) Posterior expected returns.
         """
 
-        posterior_expected_returns = self.implied_equilibrium_returns + (tau * covariance).dot(pick_matrix.T).\
-            dot(inv(pick_matrix.dot(tau * covariance).dot(pick_matrix.T) + omega).dot(investor_views - pick_matrix.dot(self.implied_equilibrium_returns)))
-        posterior_expected_returns = posterior_expected_returns.reshape(1, -1)
+        posterior_expected_returns = self.implied_equilibrium_returns + pick_tau_covariance.T.\
+            dot(cho_solve(views_factor, investor_views - pick_matrix.dot(self.implied_equilibrium_returns)))
+        posterior_expected_returns = posterior_expected_returns.T
         return posterior_expected_returns
 
     @staticmethod
-    def _calculate_posterior_covariance(covariance, tau, pick_matrix, omega):
+    def _calculate_posterior_covariance(covariance, tau_covariance, pick_tau_covariance, views_factor):
         """
         Calculate Black-Litterman covariance of asset returns from investor views.
 
         :param covariance: (pd.DataFrame/Numpy matrix) The covariance matrix of asset returns.
-        :param tau: (float) Constant of proportionality
-        :param pick_matrix: (Numpy matrix) Matrix specifying specifying which assets involved in the respective view.
-        :param omega: (Numpy matrix) Diagonal matrix of variance in investor views.
+        :param tau_covariance: (Numpy matrix) The covariance matrix of asset returns scaled by tau.
+        :param pick_tau_covariance: (Numpy matrix) Pick matrix multiplied by the tau-scaled covariance matrix (P tau Sigma).
+        :param views_factor: (tuple) Cholesky factorisation of (P tau Sigma P' + omega) as returned by scipy's cho_factor.
         :return: (Numpy array) Posterior covariance of asset returns.
         """
 
-        posterior_covariance = covariance + (tau * covariance) - (tau * covariance).dot(pick_matrix.T).\
-            dot(inv(pick_matrix.dot(tau * covariance).dot(pick_matrix.T) + omega)).dot(pick_matrix).dot(tau * covariance)
+        # Rank-K Woodbury correction U (P tau Sigma P' + omega)^-1 U' with U = tau Sigma P', written as W'W for W = L^-1 U'
+        factor, lower = views_factor
+        scaled_pick_tau_covariance = solve_triangular(factor, pick_tau_covariance, lower=lower)
+        posterior_covariance = covariance + tau_covariance - scaled_pick_tau_covariance.T.dot(scaled_pick_tau_covariance)
         return posterior_covariance
 
     @staticmethod
@@ -132,20 +269,21 @@ class BlackLitterman:
         :return: (Numpy matrix) Picking matrix.
         """
 
+        asset_indices = {name: index for index, name in enumerate(asset_names)}
         pick_matrix = np.zeros((num_views, num_assets))
-        pick_matrix = pd.DataFrame(pick_matrix, columns=asset_names)
         for view_index, pick_dict in enumerate(pick_list):
-            assets = list(pick_dict.keys())
-            values = list(pick_dict.values())
-            pick_matrix.loc[view_index, assets] = values
-        return pick_matrix.values
+            columns = np.fromiter((asset_indices[asset] for asset in pick_dict), dtype=np.intp, count=len(pick_dict))
+            # Values may be passed as single-element pandas objects, so squeeze them down to scalars
+            values = np.fromiter((np.squeeze(value) for value in pick_dict.values()), dtype=np.float64, count=len(pick_dict))
+            pick_matrix[view_index, columns] = values
+        return pick_matrix
 
-    def _calculate_omega(self, covariance, tau, pick_matrix, view_confidences, omega_method):
+    def _calculate_omega(self, covariance, views_prior_covariance, pick_matrix, view_confidences, omega_method):
         """
         Calculate the omega matrix - uncertainty in investor views.
 
         :param covariance: (pd.DataFrame/Numpy matrix) The covariance matrix of asset returns.
-        :param tau: (float) Constant of proportionality
+        :param views_prior_covariance: (Numpy matrix) Prior covariance of the views (P tau Sigma P').
         :param pick_matrix: (Numpy matrix) Matrix specifying specifying which assets involved in the respective view.
         :param view_confidences: (Numpy array/Python list) Use supplied confidences for the views. The confidences are specified
                                                            in percentages e.g. 0.05, 0.4, 0.9 etc....
@@ -154,11 +292,13 @@ class BlackLitterman:
         """
 
         if omega_method == 'prior_variance':
-            omega = pick_matrix.dot((tau * covariance).dot(pick_matrix.T))
+            omega = views_prior_covariance
         else:
             omega = self._calculate_idzorek_omega(covariance, view_confidences, pick_matrix)
-        omega = np.diag(np.diag(omega))
-        return omega
+        # Copy out the diagonal - the prior variance matrix is shared with the posterior calculations, so not in place
+        diagonal_omega = np.zeros_like(omega)
+        np.fill_diagonal(diagonal_omega, np.diagonal(omega))
+        return diagonal_omega
 
     @staticmethod
     def _calculate_idzorek_omega(covariance, view_confidences, pick_matrix):
@@ -172,23 +312,24 @@ class BlackLitterman:
         :return: (Numpy matrix) Idzorek Omega matrix.
         """
 
-        view_confidences = np.array(np.reshape(view_confidences, (1, covariance.shape[0])))
+        view_confidences = np.asarray(view_confidences, dtype=np.float64).reshape(-1)
         alpha = (1 - view_confidences) / view_confidences
-        omega = alpha * pick_matrix.dot(covariance).dot(pick_matrix.T)
+        # Only the diagonal p_k' Sigma p_k of P Sigma P' is needed, so avoid forming the full K x K product
+        view_variances = np.einsum('ki,ij,kj->k', pick_matrix, covariance, pick_matrix, optimize=True)
+        omega = np.diag(alpha * view_variances)
         return omega
 
     def _post_processing(self, asset_names):
         """
-        Final post processing of weights, expected returns and covariance matrix.
+        Final post processing of weights, expected returns and covariance matrix. Results are kept as numpy arrays;
+        the labelled DataFrames are only built on demand through the *_df properties.
 
         :param asset_names: (Numpy array/Python list) A list of strings specifying the asset names.
         """
 
         self.weights = self.weights.T
-        self.weights = pd.DataFrame(self.weights, columns=asset_names)
-        self.implied_equilibrium_returns = pd.DataFrame(self.implied_equilibrium_returns.T, columns=asset_names)
-        self.posterior_expected_returns = pd.DataFrame(self.posterior_expected_returns, columns=asset_names)
-        self.posterior_covariance = pd.DataFrame(self.posterior_covariance, columns=asset_names, index=asset_names)
+        self.implied_equilibrium_returns = self.implied_equilibrium_returns.T
+        self._asset_names = tuple(asset_names)
 
     @staticmethod
     def _error_checks(investor_views, pick_list, omega_method, view_confidences):
@@ -218,3 +359,19 @@ class BlackLitterman:
             for confidence in view_confidences:
                 if confidence < 0:
                     raise ValueError("View confidence cannot be negative. Please specify a confidence value > 0.")
+
+
+def precompute_prior(covariance, market_capitalised_weights, risk_aversion=2.5):
+    """
+    Calculate the implied equilibrium returns once so they can be shared across several BlackLitterman.allocate calls
+    with the same covariance and market weights, e.g. when sweeping over different investor views.
+
+    :param covariance: (pd.DataFrame/Numpy matrix) The covariance matrix of asset returns.
+    :param market_capitalised_weights: (Numpy array/Python list) List of market capitalised weights of portfolio assets.
+    :param risk_aversion: (float) Quantifies the risk averse nature of the investor - a higher value means more risk averse and vice-versa.
+    :return: (Numpy array) 1 x N implied equilibrium returns, the same orientation as the implied_equilibrium_returns
+                           attribute set by allocate, to be passed as the implied_equilibrium_returns argument of allocate.
+    """
+
+    covariance, market_capitalised_weights = BlackLitterman._pre_process_inputs(covariance, market_capitalised_weights)
+    return BlackLitterman._calculate_implied_equilibrium_returns(risk_aversion, covariance, market_capitalised_weights).T